@@ -1,7 +1,26 @@
 import json
 import os
+import random
 import base64
-from typing import Dict, Any
+import hashlib
+import threading
+from typing import Dict, Any, Callable, Optional
+import psycopg2
+
+# Токен тратит только запрос, запускающий распознавание, поэтому ёмкости
+# хватает на класс за одним школьным NAT, а лимит бережёт квоту OpenAI
+RATE_LIMIT_CAPACITY = 30
+RATE_LIMIT_REFILL_PER_SEC = 0.2
+RATE_LIMIT_SCOPE = 'ocr:'
+# Строки, не менявшиеся дольше времени полного пополнения, равны полной
+# корзине, поэтому их можно удалять; чистка запускается с такой вероятностью
+RATE_LIMIT_CLEANUP_PROBABILITY = 0.01
+
+# Объединение запросов работает внутри одного экземпляра функции и даёт
+# эффект только при concurrency > 1 на экземпляр. Между экземплярами
+# вызовы OpenAI ограничивает общий token bucket в Postgres (таблица rate_limits)
+_inflight: Dict[Any, 'Flight'] = {}
+_inflight_lock = threading.Lock()
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -57,63 +76,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        import requests
-        
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {openai_key}',
-                'Content-Type': 'application/json'
-            },
-            json={
-                'model': 'gpt-4o-mini',
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': [
-                            {
-                                'type': 'text',
-                                'text': 'Ты математический ассистент. Внимательно посмотри на изображение и извлеки из него математическую задачу или выражение. Верни ТОЛЬКО текст задачи/выражения, без комментариев и объяснений. Если это уравнение, запиши его в формате "2x + 5 = 15". Если это геометрическая задача, опиши её кратко с указанием данных.'
-                            },
-                            {
-                                'type': 'image_url',
-                                'image_url': {
-                                    'url': f'data:image/jpeg;base64,{image_data}'
-                                }
-                            }
-                        ]
-                    }
-                ],
-                'max_tokens': 500
-            }
+        client_key = RATE_LIMIT_SCOPE + get_client_key(event)
+        image_hash = hashlib.sha256(image_data.encode('utf-8')).hexdigest()
+        return single_flight(
+            ('ocr', image_hash),
+            lambda: recognize_image(image_data, openai_key, client_key)
         )
         
-        if response.status_code != 200:
-            return {
-                'statusCode': response.status_code,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'OpenAI API error: {response.text}'}),
-                'isBase64Encoded': False
-            }
-        
-        result = response.json()
-        extracted_text = result['choices'][0]['message']['content'].strip()
-        
-        category = detect_category(extracted_text)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'text': extracted_text,
-                'category': category
-            }),
-            'isBase64Encoded': False
-        }
-        
+    except RateLimited as e:
+        return rate_limited_response(e.retry_after)
     except Exception as e:
         return {
             'statusCode': 500,
@@ -122,6 +93,182 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
 
+def get_db_connection():
+    database_url = os.environ.get('DATABASE_URL')
+    return psycopg2.connect(database_url)
+
+def recognize_image(image_data: str, openai_key: str, client_key: str) -> Dict[str, Any]:
+    conn = get_db_connection()
+    try:
+        retry_after = take_token(conn, client_key)
+    finally:
+        conn.close()
+    if retry_after > 0:
+        raise RateLimited(retry_after)
+    
+    import requests
+    
+    response = requests.post(
+        'https://api.openai.com/v1/chat/completions',
+        headers={
+            'Authorization': f'Bearer {openai_key}',
+            'Content-Type': 'application/json'
+        },
+        json={
+            'model': 'gpt-4o-mini',
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': [
+                        {
+                            'type': 'text',
+                            'text': 'Ты математический ассистент. Внимательно посмотри на изображение и извлеки из него математическую задачу или выражение. Верни ТОЛЬКО текст задачи/выражения, без комментариев и объяснений. Если это уравнение, запиши его в формате "2x + 5 = 15". Если это геометрическая задача, опиши её кратко с указанием данных.'
+                        },
+                        {
+                            'type': 'image_url',
+                            'image_url': {
+                                'url': f'data:image/jpeg;base64,{image_data}'
+                            }
+                        }
+                    ]
+                }
+            ],
+            'max_tokens': 500
+        }
+    )
+    
+    if response.status_code != 200:
+        return {
+            'statusCode': response.status_code,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'OpenAI API error: {response.text}'}),
+            'isBase64Encoded': False
+        }
+    
+    result = response.json()
+    extracted_text = result['choices'][0]['message']['content'].strip()
+    
+    category = detect_category(extracted_text)
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'body': json.dumps({
+            'text': extracted_text,
+            'category': category
+        }),
+        'isBase64Encoded': False
+    }
+
+def get_client_key(event: Dict[str, Any]) -> str:
+    '''
+    IP клиента: адрес источника из requestContext, иначе последний хоп
+    X-Forwarded-For, добавленный прокси. Левые записи XFF задаёт сам клиент
+    '''
+    identity = (event.get('requestContext', {}) or {}).get('identity', {}) or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = event.get('headers', {}) or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return 'unknown'
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__('Too many requests')
+        self.retry_after = retry_after
+
+def take_token(conn, client_key: str) -> float:
+    '''
+    Token bucket на клиента в таблице rate_limits: возвращает 0, если запрос
+    разрешён, иначе число секунд до появления следующего токена
+    '''
+    params = {
+        'key': client_key,
+        'capacity': RATE_LIMIT_CAPACITY,
+        'rate': RATE_LIMIT_REFILL_PER_SEC
+    }
+    refilled = "LEAST(%(capacity)s, rate_limits.tokens + EXTRACT(EPOCH FROM now() - rate_limits.updated_at) * %(rate)s)"
+    
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO rate_limits (client_key, tokens, updated_at) VALUES (%(key)s, %(capacity)s - 1, now()) "
+        "ON CONFLICT (client_key) DO UPDATE SET tokens = " + refilled + " - 1, updated_at = now() "
+        "WHERE " + refilled + " >= 1 RETURNING tokens",
+        params
+    )
+    allowed = cur.fetchone() is not None
+    retry_after = 0.0
+    if not allowed:
+        cur.execute("SELECT " + refilled + " FROM rate_limits WHERE client_key = %(key)s", params)
+        retry_after = (1 - float(cur.fetchone()[0])) / RATE_LIMIT_REFILL_PER_SEC
+    if random.random() < RATE_LIMIT_CLEANUP_PROBABILITY:
+        cur.execute(
+            "DELETE FROM rate_limits WHERE updated_at < now() - %(full_after)s * interval '1 second' "
+            "AND client_key LIKE %(scope)s",
+            {'full_after': RATE_LIMIT_CAPACITY / RATE_LIMIT_REFILL_PER_SEC, 'scope': RATE_LIMIT_SCOPE + '%'}
+        )
+    conn.commit()
+    cur.close()
+    return retry_after
+
+def rate_limited_response(retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Retry-After',
+            'Retry-After': str(int(retry_after) + 1)
+        },
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+
+def single_flight(key: Any, fn: Callable[[], Any]) -> Any:
+    '''
+    Одновременные вызовы с одинаковым ключом ждут одно вычисление
+    и получают общий результат. Лимит ведущего не переходит к ожидающим:
+    после его RateLimited они повторяют попытку и тратят свои токены
+    '''
+    while True:
+        with _inflight_lock:
+            flight = _inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight()
+                _inflight[key] = flight
+        
+        if is_leader:
+            break
+        
+        flight.done.wait()
+        if isinstance(flight.error, RateLimited):
+            continue
+        if flight.error is not None:
+            raise RuntimeError(str(flight.error))
+        return flight.result
+    
+    try:
+        flight.result = fn()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        flight.done.set()
+    return flight.result
+
 def detect_category(text: str) -> str:
     text_lower = text.lower()
     
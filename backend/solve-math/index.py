@@ -1,10 +1,54 @@
 import json
 import os
+import random
 import re
-from typing import Dict, Any, List
+import threading
+from typing import Dict, Any, List, Callable, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# Токен тратит только запрос, запускающий вычисление, поэтому ёмкости
+# хватает на класс за одним школьным NAT
+RATE_LIMIT_CAPACITY = 60
+RATE_LIMIT_REFILL_PER_SEC = 1.0
+RATE_LIMIT_SCOPE = 'solve:'
+# Строки, не менявшиеся дольше времени полного пополнения, равны полной
+# корзине, поэтому их можно удалять; чистка запускается с такой вероятностью
+RATE_LIMIT_CLEANUP_PROBABILITY = 0.01
+
+SEARCH_MAX_LIMIT = 50
+
+# Совпадения ищутся по GIN-индексам всей таблицы. Ранжируются не больше
+# SEARCH_MAX_CANDIDATES из них: лимит стоит прямо на индексном сканировании,
+# без сортировки всех совпадений. Если совпадений больше, ответ помечается
+# truncated: true, и запрос стоит уточнить
+SEARCH_MAX_CANDIDATES = 1000
+
+# Фрагмент ищется как фраза из токенов (2x находит 2x, но не 12x), слова
+# объяснения - с учётом морфологии, а подстроки от трёх букв или цифр -
+# через триграммы: более коротким триграммный индекс не сужает поиск
+SEARCH_MATCH_TOKENS = (
+    "expression_tsv @@ phraseto_tsquery('simple', %(query)s) "
+    "OR explanation_tsv @@ plainto_tsquery('russian', %(query)s)"
+)
+SEARCH_MATCH_SUBSTRING = " OR expression ILIKE %(pattern)s OR answer ILIKE %(pattern)s"
+SEARCH_RANKED = (
+    "WITH probe AS (SELECT * FROM solutions WHERE {match} LIMIT %(max_candidates)s + 1), "
+    "candidates AS (SELECT * FROM probe LIMIT %(max_candidates)s) "
+    "SELECT counted.matched, page.* FROM (SELECT count(*) AS matched FROM probe) counted "
+    "LEFT JOIN (SELECT id, expression, category, answer, steps, explanation, created_at, "
+    "GREATEST(similarity(expression, %(query)s), similarity(answer, %(query)s)) "
+    "+ ts_rank(explanation_tsv, plainto_tsquery('russian', %(query)s)) AS rank "
+    "FROM candidates ORDER BY rank DESC, created_at DESC LIMIT %(limit)s OFFSET %(offset)s) page ON true "
+    "ORDER BY page.rank DESC, page.created_at DESC"
+)
+
+# Объединение запросов работает внутри одного экземпляра функции и даёт
+# эффект только при concurrency > 1 на экземпляр. Между экземплярами
+# работу ограничивает общий token bucket в Postgres (таблица rate_limits)
+_inflight: Dict[Any, 'Flight'] = {}
+_inflight_lock = threading.Lock()
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Решает математические задачи и сохраняет историю в базу данных
@@ -28,6 +72,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     if method == 'GET':
+        params = event.get('queryStringParameters', {}) or {}
+        if params.get('q'):
+            return search_history(event)
         return get_history(event)
     
     if method == 'POST':
@@ -44,6 +91,112 @@ def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
     return psycopg2.connect(database_url)
 
+def get_client_key(event: Dict[str, Any]) -> str:
+    '''
+    IP клиента: адрес источника из requestContext, иначе последний хоп
+    X-Forwarded-For, добавленный прокси. Левые записи XFF задаёт сам клиент
+    '''
+    identity = (event.get('requestContext', {}) or {}).get('identity', {}) or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = event.get('headers', {}) or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return 'unknown'
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__('Too many requests')
+        self.retry_after = retry_after
+
+def take_token(conn, client_key: str) -> float:
+    '''
+    Token bucket на клиента в таблице rate_limits: возвращает 0, если запрос
+    разрешён, иначе число секунд до появления следующего токена
+    '''
+    params = {
+        'key': client_key,
+        'capacity': RATE_LIMIT_CAPACITY,
+        'rate': RATE_LIMIT_REFILL_PER_SEC
+    }
+    refilled = "LEAST(%(capacity)s, rate_limits.tokens + EXTRACT(EPOCH FROM now() - rate_limits.updated_at) * %(rate)s)"
+    
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO rate_limits (client_key, tokens, updated_at) VALUES (%(key)s, %(capacity)s - 1, now()) "
+        "ON CONFLICT (client_key) DO UPDATE SET tokens = " + refilled + " - 1, updated_at = now() "
+        "WHERE " + refilled + " >= 1 RETURNING tokens",
+        params
+    )
+    allowed = cur.fetchone() is not None
+    retry_after = 0.0
+    if not allowed:
+        cur.execute("SELECT " + refilled + " FROM rate_limits WHERE client_key = %(key)s", params)
+        retry_after = (1 - float(cur.fetchone()[0])) / RATE_LIMIT_REFILL_PER_SEC
+    if random.random() < RATE_LIMIT_CLEANUP_PROBABILITY:
+        cur.execute(
+            "DELETE FROM rate_limits WHERE updated_at < now() - %(full_after)s * interval '1 second' "
+            "AND client_key LIKE %(scope)s",
+            {'full_after': RATE_LIMIT_CAPACITY / RATE_LIMIT_REFILL_PER_SEC, 'scope': RATE_LIMIT_SCOPE + '%'}
+        )
+    conn.commit()
+    cur.close()
+    return retry_after
+
+def rate_limited_response(retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Retry-After',
+            'Retry-After': str(int(retry_after) + 1)
+        },
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+
+def single_flight(key: Any, fn: Callable[[], Any]) -> Any:
+    '''
+    Одновременные вызовы с одинаковым ключом ждут одно вычисление
+    и получают общий результат. Лимит ведущего не переходит к ожидающим:
+    после его RateLimited они повторяют попытку и тратят свои токены
+    '''
+    while True:
+        with _inflight_lock:
+            flight = _inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight()
+                _inflight[key] = flight
+        
+        if is_leader:
+            break
+        
+        flight.done.wait()
+        if isinstance(flight.error, RateLimited):
+            continue
+        if flight.error is not None:
+            raise RuntimeError(str(flight.error))
+        return flight.result
+    
+    try:
+        flight.result = fn()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        flight.done.set()
+    return flight.result
+
 def solve_expression(event: Dict[str, Any]) -> Dict[str, Any]:
     try:
         body_data = json.loads(event.get('body', '{}'))
@@ -58,21 +211,11 @@ def solve_expression(event: Dict[str, Any]) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        solution = solve_math_problem(expression, category)
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "INSERT INTO solutions (expression, category, answer, steps, explanation) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (expression, category, solution['answer'], json.dumps(solution['steps']), solution['explanation'])
+        client_key = RATE_LIMIT_SCOPE + get_client_key(event)
+        solution = single_flight(
+            ('solve', expression.strip(), category),
+            lambda: solve_and_save(expression, category, client_key)
         )
-        solution_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        solution['id'] = solution_id
         
         return {
             'statusCode': 200,
@@ -83,6 +226,8 @@ def solve_expression(event: Dict[str, Any]) -> Dict[str, Any]:
             'body': json.dumps(solution),
             'isBase64Encoded': False
         }
+    except RateLimited as e:
+        return rate_limited_response(e.retry_after)
     except Exception as e:
         return {
             'statusCode': 500,
@@ -91,6 +236,29 @@ def solve_expression(event: Dict[str, Any]) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
 
+def solve_and_save(expression: str, category: str, client_key: str) -> Dict[str, Any]:
+    conn = get_db_connection()
+    try:
+        retry_after = take_token(conn, client_key)
+        if retry_after > 0:
+            raise RateLimited(retry_after)
+        
+        solution = solve_math_problem(expression, category)
+        
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO solutions (expression, category, answer, steps, explanation) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+            (expression, category, solution['answer'], json.dumps(solution['steps']), solution['explanation'])
+        )
+        solution_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    
+    solution['id'] = solution_id
+    return solution
+
 def get_history(event: Dict[str, Any]) -> Dict[str, Any]:
     try:
         params = event.get('queryStringParameters', {}) or {}
@@ -144,6 +312,102 @@ def get_history(event: Dict[str, Any]) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
 
+def search_history(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Ищет решения по фрагменту выражения или ответа (pg_trgm)
+    и по тексту объяснения (tsvector), результаты ранжированы и разбиты на страницы
+    '''
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        query = params.get('q', '').strip()
+        category = params.get('category')
+        
+        if not query:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Search query is required'}),
+                'isBase64Encoded': False
+            }
+        
+        try:
+            limit = int(params.get('limit', '10'))
+            offset = int(params.get('offset', '0'))
+        except ValueError:
+            limit = offset = -1
+        if not 1 <= limit <= SEARCH_MAX_LIMIT or offset < 0:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'error': f'limit must be an integer from 1 to {SEARCH_MAX_LIMIT}, '
+                             f'offset a non-negative integer'
+                }),
+                'isBase64Encoded': False
+            }
+        
+        match = SEARCH_MATCH_TOKENS
+        if re.search(r'\w{3}', query):
+            match += SEARCH_MATCH_SUBSTRING
+        match = '(' + match + ')'
+        if category:
+            match += " AND category = %(category)s"
+        args = {
+            'query': query,
+            'pattern': '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',
+            'category': category,
+            'max_candidates': SEARCH_MAX_CANDIDATES,
+            'limit': limit,
+            'offset': offset
+        }
+        
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(SEARCH_RANKED.format(match=match), args)
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        
+        matched = rows[0]['matched']
+        results = [row for row in rows if row['id'] is not None]
+        
+        solutions = []
+        for row in results:
+            solutions.append({
+                'id': row['id'],
+                'expression': row['expression'],
+                'category': row['category'],
+                'answer': row['answer'],
+                'steps': row['steps'],
+                'explanation': row['explanation'],
+                'created_at': row['created_at'].isoformat(),
+                'rank': float(row['rank'])
+            })
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({
+                'solutions': solutions,
+                'limit': limit,
+                'offset': offset,
+                'has_more': offset + len(results) < min(matched, SEARCH_MAX_CANDIDATES),
+                'truncated': matched > SEARCH_MAX_CANDIDATES,
+                'max_candidates': SEARCH_MAX_CANDIDATES
+            }),
+            'isBase64Encoded': False
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
 def solve_math_problem(expression: str, category: str) -> Dict[str, Any]:
     expression = expression.strip()
     
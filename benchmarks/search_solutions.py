@@ -0,0 +1,61 @@
+'''
+Бенчмарк search_history из backend/solve-math на данных search_solutions.sql
+Запуск: DATABASE_URL=... python benchmarks/search_solutions.py
+Печатает медиану времени ответа по каждому запросу (одно соединение на все вызовы)
+
+Замер: PostgreSQL 18, 2 млн строк, shared_buffers 1 ГБ, прогретый кэш, 1 vCPU.
+Цель 10 мс НЕ достигнута: без совпадений и для токенов почти во всех строках
+0.5-7 мс, редкие фрагменты 9-13 мс, остальные (ранжируется 1000 кандидатов)
+16-28 мс. Основное время уходит на триграммные индексы и чтение кандидатов из кучи
+'''
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'solve-math'))
+import index
+
+RUNS = 7
+
+CASES = [
+    ('короткий частый фрагмент', {'q': '2x'}),
+    ('совпадает со всеми строками', {'q': 'x +'}),
+    ('слово из объяснения + категория', {'q': 'табличное', 'category': 'trigonometry'}),
+    ('последняя страница кандидатов', {'q': '2x', 'offset': '990'}),
+    ('редкий фрагмент (~20 строк)', {'q': '17x + 512'}),
+    ('редкий фрагмент (~250 строк)', {'q': '= 7918'}),
+    ('фрагмент в ~0.1% строк', {'q': ' + 512 '}),
+    ('фрагмент в ~1% строк', {'q': '17x'}),
+    ('нет совпадений', {'q': 'zzz'}),
+    ('короткий фрагмент без совпадений', {'q': 'z2'}),
+]
+
+class SharedConnection:
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def cursor(self, **kwargs):
+        return self.conn.cursor(**kwargs)
+    
+    def close(self):
+        self.conn.rollback()
+
+def main():
+    shared = SharedConnection(index.get_db_connection())
+    index.get_db_connection = lambda: shared
+    
+    for name, params in CASES:
+        timings = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            response = index.handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+            timings.append((time.perf_counter() - started) * 1000)
+        body = json.loads(response['body'])
+        print(f"{name:42} {statistics.median(timings):8.1f} ms  найдено {len(body['solutions'])}, has_more={body['has_more']}, truncated={body['truncated']}")
+    
+    shared.conn.close()
+
+if __name__ == '__main__':
+    main()
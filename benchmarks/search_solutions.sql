@@ -0,0 +1,25 @@
+-- Данные для бенчмарка поиска (benchmarks/search_solutions.py).
+-- Запускать на отдельной базе после всех миграций:
+--   psql "$BENCH_DATABASE_URL" -f benchmarks/search_solutions.sql
+-- Категория и объяснение выбираются по разным модулям (4 и 5), поэтому
+-- каждое объяснение встречается во всех категориях.
+
+TRUNCATE solutions RESTART IDENTITY;
+
+INSERT INTO solutions (expression, category, answer, steps, explanation, created_at)
+SELECT
+    (g % 97 + 1) || 'x + ' || (g % 1013) || ' = ' || (g % 7919),
+    (ARRAY['arithmetic', 'algebra', 'geometry', 'trigonometry'])[g % 4 + 1],
+    'x = ' || round(((g % 7919) - (g % 1013))::numeric / (g % 97 + 1), 3),
+    '[]'::jsonb,
+    (ARRAY[
+        'Линейное уравнение решается путем изоляции переменной',
+        'Площадь круга вычисляется по формуле S = πr²',
+        'Синус 30° равен 1/2, это табличное значение',
+        'Выполняем арифметические операции по порядку',
+        'Объём куба с ребром a равен a³'
+    ])[g % 5 + 1],
+    now() - (g || ' seconds')::interval
+FROM generate_series(1, 2000000) AS g;
+
+VACUUM ANALYZE solutions;
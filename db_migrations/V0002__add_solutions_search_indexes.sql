@@ -0,0 +1,20 @@
+-- Только короткие блокировки: колонки без DEFAULT добавляются без перезаписи
+-- таблицы, а значения для новых строк заполняет триггер. Старые строки
+-- заполняет V0004, индексы строятся CONCURRENTLY в V0005-V0008.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE solutions ADD COLUMN IF NOT EXISTS expression_tsv tsvector;
+ALTER TABLE solutions ADD COLUMN IF NOT EXISTS explanation_tsv tsvector;
+
+CREATE OR REPLACE FUNCTION solutions_tsv_update() RETURNS trigger AS $$
+BEGIN
+    NEW.expression_tsv := to_tsvector('simple', NEW.expression || ' ' || NEW.answer);
+    NEW.explanation_tsv := to_tsvector('russian', coalesce(NEW.explanation, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS solutions_tsv_trigger ON solutions;
+CREATE TRIGGER solutions_tsv_trigger
+    BEFORE INSERT OR UPDATE OF expression, answer, explanation ON solutions
+    FOR EACH ROW EXECUTE FUNCTION solutions_tsv_update();
@@ -0,0 +1,7 @@
+-- Одна инструкция, работает и внутри транзакции мигратора. Блокируются только
+-- уже существующие строки, которые приложение не изменяет, поэтому новые
+-- решения продолжают сохраняться во время заполнения.
+UPDATE solutions
+SET expression_tsv = to_tsvector('simple', expression || ' ' || answer),
+    explanation_tsv = to_tsvector('russian', coalesce(explanation, ''))
+WHERE expression_tsv IS NULL OR explanation_tsv IS NULL;
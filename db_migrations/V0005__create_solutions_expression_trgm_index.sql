@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_solutions_expression_trgm ON solutions USING GIN (expression gin_trgm_ops);
@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_solutions_answer_trgm ON solutions USING GIN (answer gin_trgm_ops);
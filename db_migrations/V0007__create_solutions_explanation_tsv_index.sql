@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_solutions_explanation_tsv ON solutions USING GIN (explanation_tsv);
@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_solutions_expression_tsv ON solutions USING GIN (expression_tsv);